@@ -47,8 +47,14 @@ def main(
         export_report: Optional[bool] = typer.Option(True, help="save the linting results to a excel file."),
         config:Optional[str] = typer.Option(None, help="configuration file used to check the excel file. Defaults to 'config' sheet in the given excel file"),
         export_config:Optional[bool] = typer.Option(False, help="save the configuration .yml file.", hidden=True),
-        skip_tests: Optional[List[str]] = typer.Option(None, help="skip the lists of tests: [column_names, duplicate_samples, dates, unrealistic_dates, numeric_values, presence_databaseID, referring_ids, allowed_values, presence_value]" ), 
+        skip_tests: Optional[List[str]] = typer.Option(None, help="skip the lists of tests: [column_names, duplicate_samples, dates, unrealistic_dates, numeric_values, presence_databaseID, referring_ids, allowed_values, pattern_values, presence_value]" ), 
         skip_rows:Optional[int] = typer.Option(0, help="Number of rows to skip at the beginning of the excel file."),
+        jobs: Optional[int] = typer.Option(1, help="number of processes that run the row-local tests over partitions of the rows, requires pyarrow."),
+        history: Optional[str] = typer.Option(None, help="SQLite file in which the findings of every run are recorded. Defaults to 'labfilechecker_history.sqlite' in the folder of the excel file."),
+        record_history: Optional[bool] = typer.Option(True, help="record the findings of this run in the history file."),
+        diff: Optional[bool] = typer.Option(False, help="show the findings that are new or resolved since the previous run of the file. Compares the last two stored runs if this run isn't recorded."),
+        trend: Optional[bool] = typer.Option(False, help="show the number of new, recurring and resolved findings of all runs of the file."),
+        sample: Optional[float] = typer.Option(None, help="quick-check a stratified random sample of rows, a fraction (<1) or a number of rows, and estimate the error rates of the complete file. Sampled runs are not recorded in the history."),
         version: Optional[bool] = typer.Option(None, "--version", callback=version_callback)
 
         ):
@@ -59,6 +65,9 @@ def main(
 
     if not os.path.isfile(file):
         raise typer.Exit(f"{file} does not exist.")
+
+    if sample is not None and sample <= 0:
+        raise typer.Exit(f"--sample should be a fraction or a number of rows larger than 0, not {sample}.")
     
     if config is None:
         config = file 
@@ -66,7 +75,10 @@ def main(
     if report is None:
         report = os.path.splitext(file)[0] + "_report.xlsx"
 
-    lint = ExcelLint(config, file,skip_tests,skip_rows,report)
+    if history is None:
+        history = os.path.join(os.path.dirname(os.path.abspath(file)), "labfilechecker_history.sqlite")
+
+    lint = ExcelLint(config, file,skip_tests,skip_rows,report,sample,jobs)
 
     if export_config:
         with open ("config.yml","w", encoding="utf-8") as file:
@@ -78,7 +90,13 @@ def main(
     if export_report:
         lint._save_results()
     
+    if record_history and sample is None:
+        lint._save_history(history)
+
     lint._print_results()
+
+    if diff or trend:
+        lint._print_history(history, trend, recorded=record_history and sample is None)
         
 
 
@@ -0,0 +1,199 @@
+"""Local history of lint runs, to follow which findings are new, resolved or recurring between submissions of a file."""
+
+import datetime
+import hashlib
+import os
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    file TEXT NOT NULL,
+    sheet TEXT NOT NULL,
+    started TEXT NOT NULL,
+    passed INTEGER NOT NULL,
+    warned INTEGER NOT NULL,
+    failed INTEGER NOT NULL,
+    skipped INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_file_sheet ON runs (file, sheet, id);
+
+CREATE TABLE IF NOT EXISTS findings (
+    id INTEGER PRIMARY KEY,
+    fingerprint TEXT NOT NULL UNIQUE,
+    lint_test TEXT,
+    column TEXT,
+    row_key TEXT,
+    value TEXT,
+    message TEXT
+);
+
+CREATE TABLE IF NOT EXISTS run_findings (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    finding_id INTEGER NOT NULL REFERENCES findings (id),
+    status TEXT NOT NULL,
+    row INTEGER,
+    PRIMARY KEY (run_id, finding_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS run_findings_finding ON run_findings (finding_id, run_id);
+"""
+
+# Findings of these tests are identified by their test, column and value only
+ROWLESS_TESTS = ["duplicate-samples"]
+
+def finding_fingerprint(lint_test, column, row_key, value):
+    """Hash the identity of a finding: the test, the column, the key of the row and the value"""
+    identity = "\x1f".join("" if part is None else str(part) for part in (lint_test, column, row_key, value))
+    return hashlib.sha1(identity.encode("utf-8")).hexdigest()[:16]
+
+class LintHistory:
+    """An indexed SQLite store of the findings of every lint run of a file and sheet."""
+
+    def __init__(self, path:str):
+        """Open the history, creating the database if it doesn't exist yet."""
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def record_run(self, file:str, sheet:str, passed:list, warned:list, failed:list, skipped:list, row_keys:dict=None):
+        """
+        Store the warned and failed findings of a run, passed and skipped tests are only counted.
+
+        Parameters:
+            file (str): the linted excel file, runs are grouped by the file name
+            sheet (str): the linted sheet
+            passed, warned, failed, skipped (list): the LintResults of the run
+            row_keys (dict): maps row numbers to a stable key of the row like its sample ID, so findings still match when rows move
+
+        Returns:
+            run_id (int): id of the new run
+        """
+        row_keys = row_keys or {}
+        file = os.path.basename(file)
+        findings = {}
+        occurrences = {}
+        for status, results in (("warned", warned), ("failed", failed)):
+            for result in results:
+                # The value identifies a duplicate cluster, its rows can't be keyed by their duplicated ID or move with their row number
+                row_key = None if result.lint_test in ROWLESS_TESTS else row_keys.get(result.row, result.row)
+                fingerprint = finding_fingerprint(result.lint_test, result.column, row_key, result.value)
+                # Findings with the same identity, like two missing IDs in one cell, are told apart by their occurrence
+                occurrence = occurrences.get(fingerprint, 0)
+                occurrences[fingerprint] = occurrence + 1
+                if occurrence:
+                    fingerprint = finding_fingerprint(result.lint_test, result.column, f"{row_key}#{occurrence}", result.value)
+                findings[fingerprint] = (status, result, row_key)
+
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (file, sheet, started, passed, warned, failed, skipped) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file, sheet, datetime.datetime.now().isoformat(timespec="seconds"), len(passed), len(warned), len(failed), len(skipped)),
+            )
+            run_id = cursor.lastrowid
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO findings (fingerprint, lint_test, column, row_key, value, message) VALUES (?, ?, ?, ?, ?, ?)",
+                [(fingerprint, result.lint_test, _text(result.column), _text(row_key), _text(result.value), result.message)
+                 for fingerprint, (_, result, row_key) in findings.items()],
+            )
+            self.connection.executemany(
+                "INSERT INTO run_findings (run_id, finding_id, status, row) SELECT ?, id, ?, ? FROM findings WHERE fingerprint = ?",
+                [(run_id, status, _row(result.row), fingerprint) for fingerprint, (status, result, _) in findings.items()],
+            )
+        return run_id
+
+    def runs(self, file:str, sheet:str=None):
+        """List the runs of a file (and sheet) from old to new as dictionaries."""
+        query = "SELECT id, file, sheet, started, passed, warned, failed, skipped FROM runs WHERE file = ?"
+        params = [os.path.basename(file)]
+        if sheet is not None:
+            query += " AND sheet = ?"
+            params.append(sheet)
+        return self._dicts(query + " ORDER BY id", params)
+
+    def diff(self, file:str, sheet:str, new_run:int=None, old_run:int=None):
+        """
+        Compare the findings of two runs of a file and sheet.
+
+        Parameters:
+            new_run (int): id of the run to compare, defaults to the latest run
+            old_run (int): id of the run to compare with, defaults to the run before new_run
+
+        Returns:
+            new (list): findings of new_run that were not in old_run
+            resolved (list): findings of old_run that are gone in new_run
+        """
+        file = os.path.basename(file)
+        if new_run is None:
+            new_run = self._run_before(file, sheet, None)
+        if old_run is None and new_run is not None:
+            old_run = self._run_before(file, sheet, new_run)
+        if new_run is None:
+            return [], []
+
+        query = """
+            SELECT rf.row, rf.status, f.lint_test, f.column, f.row_key, f.value, f.message
+            FROM run_findings rf JOIN findings f ON f.id = rf.finding_id
+            WHERE rf.run_id = ? AND NOT EXISTS (
+                SELECT 1 FROM run_findings other WHERE other.run_id = ? AND other.finding_id = rf.finding_id)
+            ORDER BY rf.status, f.lint_test, rf.row
+        """
+        new = self._dicts(query, (new_run, old_run))
+        resolved = self._dicts(query, (old_run, new_run)) if old_run is not None else []
+        return new, resolved
+
+    def trend(self, file:str, sheet:str):
+        """Count per run of a file and sheet how many findings there were and how many were new, recurring and resolved."""
+        query = """
+            WITH ordered AS (
+                SELECT id, started, warned, failed, LAG(id) OVER (ORDER BY id) AS previous
+                FROM runs WHERE file = ? AND sheet = ?
+            ),
+            counts AS (
+                SELECT o.id, COUNT(rf.finding_id) AS findings, COUNT(prev.finding_id) AS recurring
+                FROM ordered o
+                LEFT JOIN run_findings rf ON rf.run_id = o.id
+                LEFT JOIN run_findings prev ON prev.run_id = o.previous AND prev.finding_id = rf.finding_id
+                GROUP BY o.id
+            ),
+            previous_counts AS (
+                SELECT o.id, COUNT(rf.finding_id) AS findings
+                FROM ordered o LEFT JOIN run_findings rf ON rf.run_id = o.previous
+                GROUP BY o.id
+            )
+            SELECT o.id, o.started, o.warned, o.failed,
+                   c.findings - c.recurring AS new, c.recurring, p.findings - c.recurring AS resolved
+            FROM ordered o JOIN counts c ON c.id = o.id JOIN previous_counts p ON p.id = o.id
+            ORDER BY o.id
+        """
+        return self._dicts(query, (os.path.basename(file), sheet))
+
+    def _run_before(self, file, sheet, run_id):
+        query = "SELECT MAX(id) FROM runs WHERE file = ? AND sheet = ?"
+        params = [file, sheet]
+        if run_id is not None:
+            query += " AND id < ?"
+            params.append(run_id)
+        return self.connection.execute(query, params).fetchone()[0]
+
+    def _dicts(self, query, params):
+        cursor = self.connection.execute(query, params)
+        names = [description[0] for description in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+def _text(value):
+    return None if value is None else str(value)
+
+def _row(row):
+    try:
+        return int(row)
+    except (TypeError, ValueError):
+        return None
@@ -1,6 +1,9 @@
 #!/usr/env python
 """My main script to check for inconsistencies in lab (excel) files."""
 
+import os
+import re
+import sqlite3
 import time
 import rich
 import rich.progress
@@ -13,19 +16,27 @@ from rich.table import Table
 import pandas as pd
 
 from .extract_config import extract_config
+from .history import LintHistory
+from .parallel import PartitionedRunner
+from .sampling import ROW_LOCAL_TESTS, SKETCH_TESTS, estimate_error_rates, stratified_sample
+from .utils import read_used_range
 from .lint_tests import *
 
 class ExcelLint:
     """Class to check for inconsistencies in lab (excel) files."""
     
-    def __init__(self, config:str, file:str,skip_tests:list, skip_rows:int, report:str, ):
+    def __init__(self, config:str, file:str,skip_tests:list, skip_rows:int, report:str, sample:float=None, jobs:int=1):
         """Initialize the class."""        
 
         self.config = extract_config(config)
+        self.file = file
         self.skip_rows = skip_rows
         self.report = report
+        self.sample = sample
+        self.jobs = jobs
 
-        df = pd.read_excel(file, skiprows=self.skip_rows, na_values=['NA','na','N/A','n/a','nan','NaN','NAN'], keep_default_na=False)
+        columns = [v['Column_name'] for v in self.config.values()]
+        df, self.sheet, ignored_rows, ignored_columns = read_used_range(file, self.skip_rows, columns, na_values=['NA','na','N/A','n/a','nan','NaN','NAN'])
         df  = df.reset_index().rename(columns={'index': 'Row_Number'})
         df['Row_Number'] = df['Row_Number'] + self.skip_rows +2 
         self.df = df
@@ -39,12 +50,19 @@ class ExcelLint:
             "presence_databaseID" : presence_databaseID,
             "referring_ids"       : referring_ids,
             "allowed_values"      : allowed_values,
+            "pattern_values"      : pattern_values,
             "presence_value"     : presence_value
             }
         self.passed = []
         self.warned = []
         self.failed = []
         self.skipped = []
+        self.estimates = []
+        self.notes = []
+        if ignored_rows:
+            self.notes.append(LintResult(None, None, ignored_rows, "used-range", f"Ignored {ignored_rows} trailing rows without a value in the configured columns"))
+        if ignored_columns:
+            self.notes.append(LintResult(None, None, ignored_columns, "used-range", f"Ignored {ignored_columns} columns after the last column header"))
         if skip_tests:
             skipped = [ LintResult(None, None, test, test,f"skipping {test}") for test in skip_tests]
             self.skipped.extend(skipped)
@@ -62,7 +80,9 @@ class ExcelLint:
         # Create a Progress instance with the desired format
         progress = Progress("[progress.description]{task.description}", BarColumn())
         df_noBlanks = self.df.copy().replace(to_replace = ['',' ','  '], value = pd.NA)
-        with progress:
+        if self.sample is not None:
+            sample_index = stratified_sample(df_noBlanks, self.sample).index
+        with progress, PartitionedRunner(self.jobs) as runner:
             # Define a task for the progress bar
             task = progress.add_task("[cyan]Running tests...", total=len(self.lint_tests))
 
@@ -71,7 +91,16 @@ class ExcelLint:
                 try :   
                     progress.update(task, description=f"Running test {key}")
 
-                    passed, warned, failed = lint_test(df_noBlanks if key != "presence_value" else self.df.copy(), self.config)
+                    df = df_noBlanks if key != "presence_value" else self.df.copy()
+                    if self.sample is None or (key not in ROW_LOCAL_TESTS and key not in SKETCH_TESTS):
+                        passed, warned, failed = runner.run(key, lint_test, df, self.config)
+                    elif key in SKETCH_TESTS:
+                        # Tests that need all rows are estimated from sketches of the complete columns
+                        passed, warned, failed, estimates = SKETCH_TESTS[key](df, df.loc[sample_index], self.config)
+                        self.estimates.extend(estimates)
+                    else:
+                        passed, warned, failed = lint_test(df.loc[sample_index], self.config)
+                        self.estimates.extend(estimate_error_rates(key, warned + failed, len(sample_index), ROW_LOCAL_TESTS[key](self.config)))
                     self.passed.extend(passed)
                     self.warned.extend(warned)
                     self.failed.extend(failed)
@@ -79,8 +108,13 @@ class ExcelLint:
                     time.sleep(0.1)
                 except KeyError as error:
                     self.skipped.extend([LintResult(None, None, key, key,f"KeyError: {error} \n\n !! Check your files, skipping test {key} !!")])
+                except ValueError as error:
+                    self.skipped.extend([LintResult(None, None, key, key,f"ValueError: {error} \n\n !! Check your config, skipping test {key} !!")])
+                except re.error as error:
+                    self.skipped.extend([LintResult(None, None, key, key,f"Invalid pattern {error.pattern}: {error} \n\n !! Check your config, skipping test {key} !!")])
                 # Advance the progress bar for each test
                 progress.advance(task)
+            self.notes.extend(runner.notes)
 
         # Mark the task as completed
         progress.stop()
@@ -118,6 +152,105 @@ class ExcelLint:
                 df = lint_result_to_df(self.skipped)
                 df.to_excel(excel_writer,sheet_name='skipped',index=False)            
 
+            if len(self.notes) > 0:
+                df = lint_result_to_df(self.notes)
+                df.to_excel(excel_writer,sheet_name='Notes',index=False)
+
+            if len(self.estimates) > 0:
+                df = pd.DataFrame([dict(estimate) for estimate in self.estimates])
+                df.to_excel(excel_writer,sheet_name='Estimates',index=False)
+
+
+    def _row_keys(self):
+        """Map row numbers to the value of the first unique-id column, a key of the row that survives inserted or removed rows."""
+        unique_columns = [v['Column_name'] for v in self.config.values() if v.get('Column_type') == "unique-id" and v['Column_name'] in self.df.columns]
+        if not unique_columns:
+            return {}
+        keys = self.df[['Row_Number', unique_columns[0]]].dropna()
+        # Duplicated IDs don't identify a row, those rows keep their row number as key
+        keys = keys[~keys[unique_columns[0]].duplicated(keep=False)]
+        return dict(zip(keys['Row_Number'], keys[unique_columns[0]].astype(str)))
+
+    def _save_history(self, history:str):
+        """Record the findings of this run in the history database, a history that can't be written is reported as a note."""
+        try:
+            with LintHistory(history) as lint_history:
+                lint_history.record_run(self.file, self.sheet, self.passed, self.warned, self.failed, self.skipped, self._row_keys())
+        except sqlite3.Error as error:
+            self.notes.append(LintResult(None, None, history, "history", f"Could not record this run in the history {history}: {error}"))
+
+    def _print_history(self, history:str, trend:bool=False, recorded:bool=True):
+        """
+        Print the findings that are new or resolved since the previous run of this file, and optionally the trend over all runs.
+
+        If this run wasn't recorded the last two stored runs are compared.
+        """
+        console = Console(force_terminal=True)
+        compared = "since the previous run" if recorded else "between the last two stored runs"
+
+        def format_findings(findings, color):
+            table = Table(show_header=True, header_style=f"bold {color}",style=f"{color}" )
+            table.add_column("Row")
+            table.add_column("Column")
+            table.add_column("Value")
+            table.add_column("Test")
+            table.add_column("Message")
+            for finding in findings:
+                table.add_row(
+                    str(finding['row']) if finding['row'] is not None else "",
+                    finding['column'] or "",
+                    finding['value'] or "",
+                    finding['lint_test'],
+                    finding['message'],
+                )
+            return table
+
+        try:
+            with LintHistory(history) as lint_history:
+                new, resolved = lint_history.diff(self.file, self.sheet)
+                runs = lint_history.trend(self.file, self.sheet) if trend else []
+        except sqlite3.Error as error:
+            console.print(Text(f"Could not read the history {history}: {error}", style="bold red"))
+            return
+
+        if len(new) > 0:
+            console.print(
+                rich.panel.Panel(
+                    format_findings(new, "red"),
+                    title=rf"[bold][+] {len(new)} New findings {compared}",
+                    title_align="left",
+                    style="red",
+                    padding=1,
+                )
+            )
+        if len(resolved) > 0:
+            console.print(
+                rich.panel.Panel(
+                    format_findings(resolved, "green"),
+                    title=rf"[bold][-] {len(resolved)} Resolved findings {compared}",
+                    title_align="left",
+                    style="green",
+                    padding=1,
+                )
+            )
+        if len(new) + len(resolved) == 0:
+            console.print(Text(f"No new or resolved findings {compared}", style="bold blue"))
+
+        if runs:
+            trend_table = Table(show_header=True, header_style="bold blue", style="blue")
+            for name in ["Run", "Started", "Warned", "Failed", "New", "Recurring", "Resolved"]:
+                trend_table.add_column(name)
+            for run in runs:
+                trend_table.add_row(*[str(run[key]) for key in ["id", "started", "warned", "failed", "new", "recurring", "resolved"]])
+            console.print(
+                Panel(
+                    trend_table,
+                    title=f"[bold]History of {os.path.basename(self.file)} - {self.sheet}",
+                    title_align="left",
+                    style="blue",
+                    padding=1,
+                )
+            )
 
     def _print_results(self):
         """Print linting results to the command line.
@@ -198,7 +331,50 @@ class ExcelLint:
                     padding=1,
                 )
             )
-        
+
+        # Table of notes on the data that was read
+        if len(self.notes) > 0:
+            console.print(
+                rich.panel.Panel(
+                    format_result(self.notes, "bright_black"),
+                    title=rf"[bold][i] {len(self.notes)} Notes",
+                    title_align="left",
+                    style="bright_black",
+                    padding=1,
+                )
+            )
+
+        # Table of estimated error rates of a sampled run
+        if len(self.estimates) > 0:
+            estimate_table = Table(show_header=True, header_style="bold cyan", style="cyan")
+            estimate_table.add_column("Test")
+            estimate_table.add_column("Column")
+            estimate_table.add_column("Errors")
+            estimate_table.add_column("Checked")
+            estimate_table.add_column("Error rate")
+            estimate_table.add_column("95% CI")
+            estimate_table.add_column("Method")
+
+            for estimate in self.estimates:
+                estimate_table.add_row(
+                    estimate.lint_test,
+                    str(estimate.column) if estimate.column is not None else "",
+                    str(estimate.errors),
+                    str(estimate.checked),
+                    f"{estimate.rate:.2%}",
+                    f"{estimate.lower:.2%} - {estimate.upper:.2%}",
+                    estimate.method,
+                )
+            console.print(
+                rich.panel.Panel(
+                    estimate_table,
+                    title=rf"[bold][~] Estimated error rates of {len(self.df)} rows",
+                    title_align="left",
+                    style="cyan",
+                    padding=1,
+                )
+            )
+
         summary_table = Table(show_header=True, header_style="bold blue", style="blue")
         summary_table.add_column("Passed")
         summary_table.add_column("Warned")
@@ -1,12 +1,14 @@
 class LintResult:
     """An object to hold the results of a lint test"""
 
-    def __init__(self, row,column, value, lint_test, message):
+    def __init__(self, row,column, value, lint_test, message, order=0):
         self.row  = row
         self.column = column
         self.value = value
         self.lint_test = lint_test
         self.message = message
+        # Position of the check that found it within its test, to merge the results of row partitions
+        self.order = order
 
     def __iter__(self):
         yield 'row', self.row
@@ -1,5 +1,6 @@
 import pandas as pd
 from .lint_result import LintResult
+from .utils import date_range, duplicate_clusters, is_referred, match_unique, parse_dates, referred_ids, unique_column_checks
 
 def column_names(df, config):
     """Check if all column names are correct."""
@@ -46,74 +47,72 @@ def column_names(df, config):
     return passed, warned, failed
 
 def duplicate_samples(df, config):
-    """Check if all columns or combination of columns contain unique IDs."""
-    unique_columns = [v['Column_name'] for v in config.values() if v['Column_type'] == "unique-id"]
-
-    unique_comb_columns = [[v['Column_name'],v['Unique_with']] for v in config.values() if 'Unique_with' in v.keys()]
-    unique_comb_columns = list(set(tuple(sorted(subarray)) for subarray in unique_comb_columns))
+    """Check if all columns or combination of columns contain unique IDs, duplicated rows are reported as clusters."""
+    unique_checks = unique_column_checks(config, df.columns)
+    unique_columns = [columns[0] for columns in unique_checks if len(columns) == 1]
+    unique_comb_columns = [columns for columns in unique_checks if len(columns) > 1]
 
     passed1 = []
     passed2 = []
     warned = []
     failed1 = []
     failed2 = []
-
-    if unique_columns:
-        for column in unique_columns:
-            df_dupl = df.dropna(subset=[column]).copy()
-            df_dupl = df_dupl[df_dupl.duplicated([column], keep=False)]
-            if not df_dupl.empty:
-                failed1.extend(
-                    list(map(lambda row: LintResult(
-                        row['Row_Number'],
-                        column,
-                        row[column], 
-                        'duplicate-samples', 
-                        f"{row[column]} is not a unique value column {column}"), 
-                    df_dupl.to_dict('records')))
-                )
-        if not failed1:
-            passed1 = [
-                LintResult(
-                    row=None,
-                    column=None,
-                    value="unique-columns",
-                    lint_test="duplicate_samples",
-                    message=f"No duplicates in columns {unique_columns}"
-                )]
-        
-    if unique_comb_columns:
-        for columns in unique_comb_columns: 
-            df_dupl = df.dropna(subset=columns).copy()
-            # The statement makes sure that we ignore the rows that we copied before as they started from another process so Id's will not be unique there 
-            df_dupl = df_dupl[df_dupl['Process_started_from_LVESeqID'].isnull()]
-            df_dupl = df_dupl[df_dupl.duplicated(columns, keep =False)]
-            if not df_dupl.empty:
-                failed2.extend(
-                    list(map(lambda row: LintResult(
-                        row['Row_Number'],
-                        ' ,'.join(columns),
-                        ' ,'.join([row.get(column) for column in columns]),
-                        'duplicate-samples',
-                        f"{' ,'.join([row.get(column) for column in columns])} is not a unique combination in columns {' ,'.join(columns)}"), 
-                    df_dupl.to_dict('records')))
-                )
-        if not failed2:
-            passed2 = [
-                LintResult(
-                    row=None,
-                    column=None,
-                    value="unique-combinations",
-                    lint_test="duplicate-samples",
-                    message=f"No duplicates of combinations in columns {unique_comb_columns}"
-                )]
+    cluster_id = 0
+
+    for columns, (normalise, exclusion_column) in unique_checks.items():
+        df_dupl = df.dropna(subset=list(columns))
+        # Rows that were copied from another process are not expected to be unique, the config tells us which column marks them
+        if exclusion_column:
+            df_dupl = df_dupl[df_dupl[exclusion_column].isnull()]
+        clusters = duplicate_clusters(df_dupl, list(columns), normalise)
+        if not clusters:
+            continue
+
+        values = df_dupl.set_index('Row_Number')[list(columns)]
+        for rows in clusters:
+            cluster_id += 1
+            value = ' ,'.join(str(values.at[rows[0], column]) for column in columns)
+            member_rows = ', '.join(str(row) for row in rows)
+            if len(columns) == 1:
+                failed1.append(LintResult(
+                    rows[0],
+                    columns[0],
+                    value,
+                    'duplicate-samples',
+                    f"Duplicate cluster {cluster_id}: {value} is not a unique value in column {columns[0]}, found in rows {member_rows}"))
+            else:
+                failed2.append(LintResult(
+                    rows[0],
+                    ' ,'.join(columns),
+                    value,
+                    'duplicate-samples',
+                    f"Duplicate cluster {cluster_id}: {value} is not a unique combination in columns {' ,'.join(columns)}, found in rows {member_rows}"))
+
+    if unique_columns and not failed1:
+        passed1 = [
+            LintResult(
+                row=None,
+                column=None,
+                value="unique-columns",
+                lint_test="duplicate_samples",
+                message=f"No duplicates in columns {unique_columns}"
+            )]
+    if unique_comb_columns and not failed2:
+        passed2 = [
+            LintResult(
+                row=None,
+                column=None,
+                value="unique-combinations",
+                lint_test="duplicate-samples",
+                message=f"No duplicates of combinations in columns {unique_comb_columns}"
+            )]
     passed = passed1 + passed2
     failed = failed1 + failed2
     return passed, warned, failed
 
 def dates(df, config):
     """Check if all date columns are in the correct format."""
-    date_columns = [v['Column_name'] for v in config.values() if v['Column_type'] == "date"]
+    date_columns = [v for v in config.values() if v['Column_type'] == "date"]
 
     passed = []
     warned = []
@@ -122,42 +121,38 @@ def dates(df, config):
     if not date_columns:
         return passed, warned, failed
 
-    # Melt the dataframe
-    melted_df = pd.melt(df[date_columns + ['Row_Number']], id_vars='Row_Number', var_name='column', value_name='value')
-    
-    # Drop rows with NaN values
-    melted_df = melted_df.dropna()
-
-    # Convert the value column to a datetime column
-    melted_df['transformed_date'] = pd.to_datetime(melted_df['value'], errors='coerce')
+    for order, v in enumerate(date_columns):
+        column = v['Column_name']
+        values = df[column].dropna()
 
-    # Get the rows with NaN values
-    failed_dates = melted_df[melted_df['transformed_date'].isnull()]
-    if not failed_dates.empty:
+        # Parse the unique values in the configured format and get the ones that aren't a date
+        failed_dates = values[parse_dates(values, v.get('Date_format')).isnull()]
         warned.extend(
-            list(map(lambda row: LintResult(
-                row['Row_Number'], 
-                row['column'],
-                row['value'], 
+            list(map(lambda row, value: LintResult(
+                row, 
+                column,
+                value, 
                 'dates', 
-                f"{row['value']} is not a date in column {row['column']}"), 
-            failed_dates.to_dict('records')))
+                f"{value} is not a date in column {column}",
+                order), 
+            df.loc[failed_dates.index, 'Row_Number'], failed_dates))
         )
-    else:
+
+    if not warned:
         passed.extend([
             LintResult(
                 row=None,
                 column=None,
                 value="non-existing-dates",
                 lint_test="dates",
-                message=f"All values in column {', '.join(date_columns)} are dates"
+                message=f"All values in column {', '.join([v['Column_name'] for v in date_columns])} are dates"
             )]
         )
     return passed, warned, failed
 
 def unrealistic_dates(df, config):
-    """Check if all date columns are in the correct format."""
-    date_columns = [v['Column_name'] for v in config.values() if v['Column_type'] == "date"]
+    """Check if all dates are in between the configured Min_date and Max_date."""
+    date_columns = [v for v in config.values() if v['Column_type'] == "date"]
 
     passed = []
     warned = []
@@ -166,40 +161,33 @@ def unrealistic_dates(df, config):
     if not date_columns:
         return passed, warned, failed
 
-    # Melt the dataframe
-    melted_df = pd.melt(df[date_columns + ['Row_Number']], id_vars='Row_Number', var_name='column', value_name='value')
-    
-    # Drop rows with NaN values
-    melted_df = melted_df.dropna()
-
-    # Convert the value column to a datetime column
-    melted_df['transformed_date'] = pd.to_datetime(melted_df['value'], errors='coerce')
-
-    # Define the range we want to look at
-    today  = pd.to_datetime('today').floor('D')
-    min_date = today - pd.DateOffset(years=6)
-    
-    # Filter for those that are outside the range
-    failed_dates = melted_df[(melted_df['transformed_date'] < min_date) | (melted_df['transformed_date'] > today)]
+    for order, v in enumerate(date_columns):
+        column = v['Column_name']
+        values = df[column].dropna()
+        transformed_dates = parse_dates(values, v.get('Date_format'))
 
-    if not failed_dates.empty:
+        # Filter for those that are outside the range
+        min_date, max_date = date_range(v)
+        failed_dates = values[(transformed_dates < min_date) | (transformed_dates > max_date)]
         warned.extend(
-            list(map(lambda row: LintResult(
-                row['Row_Number'], 
-                row['column'],
-                row['value'], 
+            list(map(lambda row, value: LintResult(
+                row, 
+                column,
+                value, 
                 'unrealistic-dates', 
-                f"{row['value']} has a questionable date in column {row['column']}"), 
-            failed_dates.to_dict('records')))
+                f"{value} has a questionable date in column {column}, expected a date between {min_date.date()} and {max_date.date()}",
+                order), 
+            df.loc[failed_dates.index, 'Row_Number'], failed_dates))
         )
-    else:
+
+    if not warned:
         passed.extend([
             LintResult(
                 row=None,
                 column=None,
                 value="unrealistic-dates",
                 lint_test="dates",
-                message=f"All values in column {', '.join(date_columns)} are realistic dates"
+                message=f"All values in column {', '.join([v['Column_name'] for v in date_columns])} are realistic dates"
             )]
         )
     return passed, warned, failed
@@ -232,7 +220,8 @@ def numeric_values(df, config):
                 row['column'],
                 row['value'], 
                 'numeric', 
-                f"{row['value']} is not a numeric value in column {row['column']}"), 
+                f"{row['value']} is not a numeric value in column {row['column']}",
+                numeric_columns.index(row['column'])), 
                 failed_values.to_dict('records')))
         )
     else:
@@ -252,7 +241,7 @@ def presence_databaseID(df, config):
     warned = []
     failed = []
     df_lassa = df[df['Sample_Catagory'] == 'LASSA SAMPLE']
-    for column in ['Database_PatientID', 'Database_idSpecimen']:
+    for order, column in enumerate(['Database_PatientID', 'Database_idSpecimen']):
         df_lassa_subset = df_lassa[df_lassa[column].isnull()]
         if not df_lassa_subset.empty:
             failed.extend(
@@ -261,7 +250,8 @@ def presence_databaseID(df, config):
                     'SampleID', 
                     row['SampleID'], 
                     column, 
-                    f"The lassa ID: {row['SampleID']} - was not found in the database, make sure it's written correctly (no leading zeros, correct year ...XXLVYY)"), 
+                    f"The lassa ID: {row['SampleID']} - was not found in the database, make sure it's written correctly (no leading zeros, correct year ...XXLVYY)",
+                    order), 
                 df_lassa_subset.to_dict('records')))
             )
 
@@ -276,9 +266,13 @@ def presence_databaseID(df, config):
             )]
     return passed, warned, failed
 
-def referring_ids(df, config):
-    """Check if the referred IDs do really exist."""
+def referring_ids(df, config, referred=None):
+    """Check if the referred IDs do really exist, referred maps referred columns to their referred_ids if they're already known."""
     referring_columns = [[v['Column_name'],v['Is_referring_to']] for v in config.values() if 'Is_referring_to' in v.keys() and 'Separation_character' not in v.keys()]
+    referred = dict(referred or {})
+    for v in config.values():
+        if 'Is_referring_to' in v.keys() and v['Is_referring_to'] not in referred:
+            referred[v['Is_referring_to']] = referred_ids(df[v['Is_referring_to']])
 
     passed1 = []
     passed2 = []
@@ -289,9 +283,9 @@ def referring_ids(df, config):
     
 
     if referring_columns:
-        for arr in referring_columns:
+        for order, arr in enumerate(referring_columns):
             df_ref = df[df[arr[0]].notnull()].copy()
-            df_ref = df_ref[~df_ref[arr[0]].isin(df[arr[1]])]
+            df_ref = df_ref[~is_referred(df_ref[arr[0]], referred[arr[1]])]
             if not df_ref.empty:
                 failed1.extend(
                     list(map(lambda row: LintResult(
@@ -299,7 +293,8 @@ def referring_ids(df, config):
                         arr[0],
                         row[arr[0]], 
                         'referring_ids', 
-                        f"{row[arr[0]]} is not in {arr[1]}"), 
+                        f"{row[arr[0]]} is not in {arr[1]}",
+                        order), 
                     df_ref.to_dict('records')))
                 )
         if not failed1:
@@ -315,11 +310,11 @@ def referring_ids(df, config):
     # need to check that df[arr[0]] in df[arr[1]] exists for all arr in referring_columns
     referring_columns_with_sep = [[v['Column_name'],v['Is_referring_to'],v['Separation_character']] for v in config.values() if 'Is_referring_to' in v.keys() and 'Separation_character' in v.keys()]
     if referring_columns_with_sep:
-        for arr in referring_columns_with_sep:
+        for order, arr in enumerate(referring_columns_with_sep, len(referring_columns)):
             df_ref = df[df[arr[0]].notnull()].copy()
             df_ref['col_seperated'] = df_ref[arr[0]].str.split(arr[2])
             df_ref = df_ref.explode('col_seperated')
-            df_ref = df_ref[~df_ref['col_seperated'].isin(df[arr[1]])]
+            df_ref = df_ref[~is_referred(df_ref['col_seperated'], referred[arr[1]])]
             
             if not df_ref.empty:
                 failed2.extend(
@@ -328,7 +323,8 @@ def referring_ids(df, config):
                         arr[0],
                         row[arr[0]], 
                         'referring-ids', 
-                        f"The value {row['col_seperated']} from {' ,'.join(row[arr[0]].split(arr[2]))} is not in {arr[1]}"), 
+                        f"The value {row['col_seperated']} from {' ,'.join(row[arr[0]].split(arr[2]))} is not in {arr[1]}",
+                        order), 
                     df_ref.to_dict('records')))
                 )
         if not failed2:
@@ -354,7 +350,7 @@ def allowed_values(df,config):
     if not allowed_columns:
         return passed, warned, failed
     
-    for arr in allowed_columns:
+    for order, arr in enumerate(allowed_columns):
         df_ref = df[df[arr[0]].notnull()]
         df_ref = df_ref[~df_ref[arr[0]].isin(arr[1])]
         if not df_ref.empty:
@@ -364,7 +360,8 @@ def allowed_values(df,config):
                     arr[0],
                     row[arr[0]], 
                     'allowed-values', 
-                    f"{row[arr[0]]} is not in the range of allowed values {' ,'.join(arr[1])}"), 
+                    f"{row[arr[0]]} is not in the range of allowed values {' ,'.join(arr[1])}",
+                    order), 
                 df_ref.to_dict('records')))
             )
     
@@ -379,6 +376,42 @@ def allowed_values(df,config):
             )]
     return passed, warned, failed
 
+def pattern_values(df, config):
+    """Check if the values of the columns match their regular expression pattern."""
+    pattern_columns = [[v['Column_name'],v['Pattern']] for v in config.values() if 'Pattern' in v.keys() or v['Column_type'] == "pattern"]
+    passed = []
+    warned = []
+    failed = []
+
+    if not pattern_columns:
+        return passed, warned, failed
+
+    for order, arr in enumerate(pattern_columns):
+        df_ref = df[df[arr[0]].notnull()]
+        df_ref = df_ref[~match_unique(df_ref[arr[0]], arr[1])]
+        if not df_ref.empty:
+            warned.extend(
+                list(map(lambda row: LintResult(
+                    row['Row_Number'], 
+                    arr[0],
+                    row[arr[0]], 
+                    'pattern-values', 
+                    f"{row[arr[0]]} does not match the pattern {arr[1]} of column {arr[0]}",
+                    order), 
+                df_ref[['Row_Number', arr[0]]].to_dict('records')))
+            )
+
+    if not warned:
+        passed = [
+            LintResult(
+                row=None,
+                column=None,
+                value=None,
+                lint_test="pattern-values",
+                message=f"All values match their pattern in columns: {' ,'.join([sublist[0] for sublist in pattern_columns ])}"
+            )]
+    return passed, warned, failed
+
 def presence_value(df,config):
     """Check if any values are present if the first column has a value"""
     columns = [v['Column_name'] for v in config.values()]
@@ -388,16 +421,16 @@ def presence_value(df,config):
     warned = []
     failed = []
 
-    df = df[df[columns[0]].astype(str).str.contains(pattern, regex=True)]
+    # rows with a missing value in the first column are kept, as their text 'nan' has a value
+    df = df[match_unique(df[columns[0]], pattern, search=True, missing=True)]
     melted_df = pd.melt(df[columns + ['Row_Number']], id_vars='Row_Number', var_name='column', value_name='value')
     
     # remove rows where value is null
     melted_df = melted_df[melted_df['value'].notnull()]
 
-    melted_df['value'] = melted_df['value'].astype(str)
-
     # keep rows where value is blank
-    blank_df = melted_df[~melted_df['value'].str.contains(pattern, regex=True)]
+    blank_df = melted_df[~match_unique(melted_df['value'], pattern, search=True)]
+    blank_df = blank_df.assign(value=blank_df['value'].astype(str))
 
     if not blank_df.empty:
         warned.extend(
@@ -406,7 +439,8 @@ def presence_value(df,config):
                 row['column'],
                 row['value'],
                 'presence-value',
-                f"The value {row['value']} seems to be blank in column {row['column']}"),
+                f"The value {row['value']} seems to be blank in column {row['column']}",
+                columns.index(row['column'])),
             blank_df.to_dict('records')))
             )
     else : 
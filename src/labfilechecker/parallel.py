@@ -0,0 +1,217 @@
+"""Run row-local lint tests over partitions of the rows in a pool of processes."""
+
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Shared memory is only available from Python 3.8
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+from .lint_result import LintResult
+from .sampling import ROW_LOCAL_TESTS
+from .utils import referred_ids
+
+# Tests that only need the rows of a partition, referring_ids also gets the referred IDs of all rows
+PARTITIONED_TESTS = list(ROW_LOCAL_TESTS) + ["referring_ids"]
+
+# Partitions smaller than this aren't worth the overhead of a process
+MIN_PARTITION_ROWS = 50000
+
+# Columns a test reads besides the configured columns it checks, see ROW_LOCAL_TESTS
+READ_COLUMNS = {
+    "presence_databaseID" : lambda config: ['SampleID', 'Sample_Catagory', 'Database_PatientID', 'Database_idSpecimen'],
+    "referring_ids"       : lambda config: [v['Column_name'] for v in config.values() if 'Is_referring_to' in v.keys()],
+}
+
+def read_columns(key, config, df):
+    """The columns of df a partitioned test reads, only these are shared with the workers"""
+    columns = READ_COLUMNS[key](config) if key in READ_COLUMNS else ROW_LOCAL_TESTS[key](config)
+    return ['Row_Number'] + [column for column in dict.fromkeys(columns) if column in df.columns and column != 'Row_Number']
+
+class SharedFrame:
+    """A dataframe written once as an Arrow stream into shared memory, workers read it without copying or pickling"""
+
+    def __init__(self, df):
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except pa.ArrowException:
+            failing = [column for column in df.columns if not _converts(df[column])]
+            raise TypeError(f"the columns {', '.join(failing)} can't be converted to Arrow")
+
+        # Columns that don't survive the round trip, like object columns with mixed types, can't be shared
+        changed = [column for column, dtype in table.slice(0, 0).to_pandas().dtypes.items() if dtype != df.dtypes[column]]
+        if changed:
+            raise TypeError(f"the types of columns {', '.join(changed)} change when converted to Arrow")
+
+        mock = pa.MockOutputStream()
+        with pa.ipc.new_stream(mock, table.schema) as writer:
+            writer.write_table(table)
+        self.size = mock.size()
+
+        self.memory = shared_memory.SharedMemory(create=True, size=max(self.size, 1))
+        buffer = pa.py_buffer(self.memory.buf)
+        stream = pa.FixedSizeBufferWriter(buffer)
+        with pa.ipc.new_stream(stream, table.schema) as writer:
+            writer.write_table(table)
+        # The shared memory can only be closed once no buffer exports it anymore
+        stream.close()
+        del writer, stream, buffer
+        self.name = self.memory.name
+
+    def close(self):
+        self.memory.close()
+        self.memory.unlink()
+
+class SharedArray:
+    """A numpy array copied once into shared memory, workers view it without copying or pickling"""
+
+    def __init__(self, array):
+        self.dtype = array.dtype
+        self.length = len(array)
+        self.memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(self.length, dtype=self.dtype, buffer=self.memory.buf)[:] = array
+        self.name = self.memory.name
+
+    def close(self):
+        self.memory.close()
+        self.memory.unlink()
+
+def _converts(series):
+    try:
+        pa.Array.from_pandas(series)
+        return True
+    except pa.ArrowException:
+        return False
+
+def _attach(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+def _run_partition(lint_test, name, size, start, stop, config, referred):
+    """Run a lint test on rows start:stop of a shared frame, this runs in a worker process."""
+    memories = [_attach(name)] + [_attach(array_name) for array_name, _, _ in referred.values()]
+    try:
+        return _run_on_buffers(lint_test, [memory.buf for memory in memories], size, start, stop, config, referred)
+    finally:
+        # The frames of the test may still view the shared memory if it raised, it's released with the worker then
+        for memory in memories:
+            try:
+                memory.close()
+            except BufferError:
+                pass
+
+def _run_on_buffers(lint_test, buffers, size, start, stop, config, referred):
+    # Every Arrow, numpy and pandas view on the shared memory goes out of scope when this returns
+    table = pa.ipc.open_stream(pa.py_buffer(buffers[0])[:size]).read_all()
+    df = table.slice(start, stop - start).to_pandas()
+    if referred:
+        arrays = {
+            column: np.ndarray(length, dtype=dtype, buffer=buffer)
+            for (column, (_, dtype, length)), buffer in zip(referred.items(), buffers[1:])
+        }
+        return lint_test(df, config, referred=arrays)
+    return lint_test(df, config)
+
+def merge_results(partials):
+    """
+    Merge the results of the partitions of a test into the results of the complete frame.
+
+    A check passed if it passed in every partition. The findings are put in the order of the serial test:
+    per check of the test, then per row. The sort is stable, so the findings of a row keep their order.
+    """
+    def order(result):
+        return (result.order, result.row)
+
+    passed = [
+        result for result in partials[0][0]
+        if all(any(dict(result) == dict(other) for other in partial[0]) for partial in partials[1:])
+    ]
+    warned = sorted([result for partial in partials for result in partial[1]], key=order)
+    failed = sorted([result for partial in partials for result in partial[2]], key=order)
+    return passed, warned, failed
+
+class PartitionedRunner:
+    """Runs row-local lint tests over row partitions in a process pool, falls back to running them serially."""
+
+    def __init__(self, jobs:int, min_partition_rows:int=MIN_PARTITION_ROWS):
+        self.jobs = jobs
+        self.min_partition_rows = min_partition_rows
+        self.pool = None
+        self.frames = {}
+        self.notes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        for _, frame in self.frames.values():
+            if isinstance(frame, SharedFrame):
+                frame.close()
+        self.frames = {}
+
+    def _share(self, df, columns):
+        """Share the columns of df once, returns the shared frame or the reason why it can't be shared."""
+        # Keep a reference to the frame, so its id can't be reused by another frame
+        key = (id(df), tuple(columns))
+        if key not in self.frames:
+            try:
+                frame = SharedFrame(df[columns])
+            except TypeError as error:
+                frame = str(error)
+            self.frames[key] = (df, frame)
+        return self.frames[key][1]
+
+    def _note(self, message):
+        if all(note.message != message for note in self.notes):
+            self.notes.append(LintResult(None, None, self.jobs, "jobs", message))
+
+    def run(self, key, lint_test, df, config):
+        """Run a lint test on df, over partitions of the rows if that's possible and worth it."""
+        partitions = min(self.jobs, len(df) // self.min_partition_rows)
+        if key not in PARTITIONED_TESTS or partitions < 2:
+            return lint_test(df, config)
+        if pa is None or shared_memory is None:
+            self._note("Ran all tests in a single process, --jobs requires pyarrow and Python 3.8 or later")
+            return lint_test(df, config)
+
+        frame = self._share(df, read_columns(key, config, df))
+        if isinstance(frame, str):
+            self._note(f"Ran {key} in a single process, {frame}")
+            return lint_test(df, config)
+
+        # The referred IDs are hashed once for all partitions
+        arrays = {}
+        if key == "referring_ids":
+            for v in config.values():
+                if 'Is_referring_to' in v.keys() and v['Is_referring_to'] not in arrays:
+                    arrays[v['Is_referring_to']] = SharedArray(referred_ids(df[v['Is_referring_to']]))
+        referred = {column: (array.name, array.dtype, array.length) for column, array in arrays.items()}
+
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.jobs)
+        bounds = [len(df) * i // partitions for i in range(partitions + 1)]
+        try:
+            futures = [
+                self.pool.submit(_run_partition, lint_test, frame.name, frame.size, start, stop, config, referred)
+                for start, stop in zip(bounds[:-1], bounds[1:])
+            ]
+            return merge_results([future.result() for future in futures])
+        finally:
+            for array in arrays.values():
+                array.close()
@@ -0,0 +1,210 @@
+"""Quick-check mode: lint a stratified sample of the rows and estimate the error rates of the complete file."""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from .lint_result import LintResult
+from .utils import fingerprint, id_hashes, unique_column_checks
+
+# Tests that only look at a row at a time, these are run on the sample as is. Maps each test to the configured
+# columns it checks, an error rate is estimated per column
+ROW_LOCAL_TESTS = {
+    "dates"               : lambda config: [v['Column_name'] for v in config.values() if v['Column_type'] == "date"],
+    "unrealistic_dates"   : lambda config: [v['Column_name'] for v in config.values() if v['Column_type'] == "date"],
+    "numeric_values"      : lambda config: [v['Column_name'] for v in config.values() if v['Column_type'] == "numeric"],
+    "presence_databaseID" : lambda config: ['SampleID'],
+    "allowed_values"      : lambda config: [v['Column_name'] for v in config.values() if 'Allowed_values' in v.keys()],
+    "pattern_values"      : lambda config: [v['Column_name'] for v in config.values() if 'Pattern' in v.keys() or v['Column_type'] == "pattern"],
+    "presence_value"      : lambda config: [v['Column_name'] for v in config.values()],
+}
+
+class ErrorEstimate:
+    """An object to hold the estimated error rate of a lint test in a column"""
+
+    def __init__(self, lint_test, column, errors, checked, rate, lower, upper, method):
+        self.lint_test = lint_test
+        self.column = column
+        self.errors = errors
+        self.checked = checked
+        self.rate = rate
+        self.lower = lower
+        self.upper = upper
+        self.method = method
+
+    def __iter__(self):
+        yield 'lint_test', self.lint_test
+        yield 'column', self.column
+        yield 'errors', self.errors
+        yield 'checked', self.checked
+        yield 'rate', self.rate
+        yield 'lower', self.lower
+        yield 'upper', self.upper
+        yield 'method', self.method
+
+    def __str__(self):
+        return f"ErrorEstimate(test: {self.lint_test}, column: {self.column}, rate: {self.rate:.4%} [{self.lower:.4%} - {self.upper:.4%}], method: {self.method})"
+
+class BloomFilter:
+    """Set membership of 64 bit hashes without false negatives and a small rate of false positives"""
+
+    def __init__(self, capacity:int, error_rate:float=0.001):
+        capacity = max(capacity, 1)
+        self.size = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = np.zeros(self.size, dtype=bool)
+
+    def _positions(self, hashes):
+        # Double hashing: derive all hash functions from the two halves of the 64 bit hash
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        low = hashes & np.uint64(0xFFFFFFFF)
+        high = (hashes >> np.uint64(32)) | np.uint64(1)
+        steps = np.arange(self.hash_count, dtype=np.uint64)
+        return (low[:, None] + steps[None, :] * high[:, None]) % np.uint64(self.size)
+
+    def add(self, hashes:np.ndarray):
+        """Add an array of uint64 hashes."""
+        self.bits[self._positions(hashes).ravel()] = True
+
+    def contains(self, hashes:np.ndarray):
+        """Boolean array telling which hashes might have been added, False is always correct."""
+        return self.bits[self._positions(hashes)].all(axis=1)
+
+def stratified_sample(df, size, strata:int=10, seed:int=0):
+    """
+    Draw a random sample of rows spread evenly over consecutive blocks of the file.
+
+    Parameters:
+        df (pd.DataFrame): rows to sample from
+        size (float): fraction of the rows if smaller than 1, otherwise the number of rows
+        strata (int): number of consecutive blocks of rows that are sampled proportionally
+        seed (int): seed of the random generator, so runs are reproducible
+
+    Returns:
+        sample (pd.DataFrame): the sampled rows in their original order
+    """
+    total = len(df)
+    size = int(round(size * total)) if size < 1 else int(size)
+    if size >= total:
+        return df
+
+    rng = np.random.default_rng(seed)
+    blocks = np.array_split(np.arange(total), min(strata, max(size, 1)))
+    positions = [rng.choice(block, int(round(size * len(block) / total)), replace=False) for block in blocks if len(block) > 0]
+    return df.iloc[np.sort(np.concatenate(positions))]
+
+def wilson_interval(errors:int, checked:int, z:float=1.96):
+    """Wilson score confidence interval of a proportion, by default at 95%."""
+    if checked == 0:
+        return 0.0, 1.0
+    rate = errors / checked
+    denominator = 1 + z ** 2 / checked
+    centre = (rate + z ** 2 / (2 * checked)) / denominator
+    margin = z * math.sqrt(rate * (1 - rate) / checked + z ** 2 / (4 * checked ** 2)) / denominator
+    return max(centre - margin, 0.0), min(centre + margin, 1.0)
+
+def estimate_error_rates(lint_test, results, checked, columns, method="sample"):
+    """Estimate the rate of rows with an error of a test per checked column from the findings of a sample of checked rows."""
+    rows = {column: set() for column in columns}
+    for result in results:
+        rows.setdefault(result.column, set()).add(result.row)
+
+    estimates = []
+    for column, failing_rows in rows.items():
+        lower, upper = wilson_interval(len(failing_rows), checked)
+        estimates.append(ErrorEstimate(lint_test, column, len(failing_rows), checked, len(failing_rows) / max(checked, 1), lower, upper, method))
+    return estimates
+
+def duplicate_samples_sketch(df, sample, config):
+    """Count the rows with a duplicated value of the unique columns and combinations exactly from the fingerprints of all rows."""
+    passed = []
+    warned = []
+    failed = []
+    estimates = []
+    total = len(df)
+
+    for columns, (normalise, exclusion_column) in unique_column_checks(config, df.columns).items():
+        df_dupl = df.dropna(subset=list(columns))
+        if exclusion_column:
+            df_dupl = df_dupl[df_dupl[exclusion_column].isnull()]
+
+        # Every row of a value that occurs more than once is a duplicated row, like the full test reports them
+        duplicated = int(fingerprint(df_dupl, list(columns), normalise).duplicated(keep=False).sum())
+        column = ' ,'.join(columns)
+        rate = duplicated / max(total, 1)
+        estimates.append(ErrorEstimate('duplicate_samples', column, duplicated, total, rate, rate, rate, "fingerprints"))
+
+        if duplicated > 0:
+            warned.append(LintResult(
+                None,
+                column,
+                None,
+                'duplicate-samples',
+                f"{duplicated} rows have a duplicated value in {column}, run without --sample to find them"))
+
+    if estimates and not warned:
+        passed = [
+            LintResult(
+                row=None,
+                column=None,
+                value="unique-columns",
+                lint_test="duplicate-samples",
+                message=f"No duplicates detected in columns {[estimate.column for estimate in estimates]}"
+            )]
+    return passed, warned, failed, estimates
+
+def referring_ids_sketch(df, sample, config):
+    """Check the referred IDs of the sampled rows against a Bloom filter of the referred columns of all rows."""
+    referring_columns = [[v['Column_name'],v['Is_referring_to'],None] for v in config.values() if 'Is_referring_to' in v.keys() and 'Separation_character' not in v.keys()]
+    referring_columns += [[v['Column_name'],v['Is_referring_to'],v['Separation_character']] for v in config.values() if 'Is_referring_to' in v.keys() and 'Separation_character' in v.keys()]
+
+    passed = []
+    warned = []
+    failed = []
+    blooms = {}
+
+    for arr in referring_columns:
+        if arr[1] not in blooms:
+            # Hashed like the full test compares IDs, so 7 and 7.0 are the same ID but '7' isn't
+            referred = df[arr[1]]
+            blooms[arr[1]] = BloomFilter(len(referred))
+            blooms[arr[1]].add(id_hashes(referred))
+
+        df_ref = sample[sample[arr[0]].notnull()].copy()
+        if arr[2] is not None:
+            df_ref['col_seperated'] = df_ref[arr[0]].str.split(arr[2])
+            df_ref = df_ref.explode('col_seperated')
+        else:
+            df_ref['col_seperated'] = df_ref[arr[0]]
+        # A Bloom filter has no false negatives, so the IDs that aren't in it are certainly missing
+        df_ref = df_ref[~blooms[arr[1]].contains(id_hashes(df_ref['col_seperated']))]
+
+        if not df_ref.empty:
+            failed.extend(
+                list(map(lambda row: LintResult(
+                    row['Row_Number'],
+                    arr[0],
+                    row[arr[0]],
+                    'referring-ids',
+                    f"{row['col_seperated']} is not in {arr[1]}"),
+                df_ref.to_dict('records')))
+            )
+
+    if referring_columns and not failed:
+        passed = [
+            LintResult(
+                row=None,
+                column=None,
+                value='non-existing-ids',
+                lint_test="referring-ids",
+                message=f"All sampled values in columns {[arr[0] for arr in referring_columns]} refer to existing IDs"
+            )]
+    estimates = estimate_error_rates('referring_ids', failed, len(sample), [arr[0] for arr in referring_columns], "sample, bloom filter") if referring_columns else []
+    return passed, warned, failed, estimates
+
+# Tests that need all rows, these are estimated from sketches of the complete columns
+SKETCH_TESTS = {
+    "duplicate_samples" : duplicate_samples_sketch,
+    "referring_ids"     : referring_ids_sketch,
+}
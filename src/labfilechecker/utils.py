@@ -1,7 +1,351 @@
+import functools
+import os
+import re
+
 from rich.text import Text
 from rich.table import Table
+import numpy as np
+import openpyxl
 import pandas as pd
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from pandas.io.parsers import TextParser
 
 def flatten(list):
     """Flatten a list of lists"""
     return [item for sublist in list for item in sublist]
+
+def is_true(value):
+    """Interpret a config flag, excel configs give strings like 'yes' or 'TRUE'"""
+    if isinstance(value, str):
+        return value.strip().lower() in ['yes', 'y', 'true', '1']
+    return bool(value)
+
+def split_columns(value):
+    """Split a config value listing one or more columns separated by a ','"""
+    if isinstance(value, (list, tuple)):
+        return [str(column).strip() for column in value]
+    return [column.strip() for column in str(value).split(',') if column.strip()]
+
+# Column that marked continuation rows before Ignore_duplicates_if could be configured
+DEFAULT_EXCLUSION_COLUMN = 'Process_started_from_LVESeqID'
+
+def unique_column_checks(config, df_columns=()):
+    """
+    Collect the columns and combinations of columns that should be unique.
+
+    Parameters:
+        config (dict): the configuration of the columns
+        df_columns (list): columns of the file, combinations without Ignore_duplicates_if exclude the rows with a
+            value in Process_started_from_LVESeqID if the file has that column, like older versions did
+
+    Returns:
+        checks (dict): maps a tuple of columns to their (normalise, exclusion column) settings
+    """
+    checks = {}
+    for v in config.values():
+        if v['Column_type'] == "unique-id":
+            columns = (v['Column_name'],)
+        elif 'Unique_with' in v.keys():
+            columns = tuple(sorted(set([v['Column_name']] + split_columns(v['Unique_with']))))
+        else:
+            continue
+        exclusion_column = v.get('Ignore_duplicates_if')
+        if exclusion_column is None and len(columns) > 1 and DEFAULT_EXCLUSION_COLUMN in df_columns:
+            exclusion_column = DEFAULT_EXCLUSION_COLUMN
+        # The first definition of a column (combination) decides on normalisation and excluded rows
+        checks.setdefault(columns, (is_true(v.get('Normalise', False)), exclusion_column))
+    return checks
+
+def normalise_values(series):
+    """Normalise values so near-duplicates compare equal: case, surrounding/repeated whitespace and leading zeros"""
+    normalised = series.astype(str).str.strip().str.casefold()
+    normalised = normalised.str.replace(r'\s+', ' ', regex=True)
+    # strip leading zeros of every number in the value, 'LV007' -> 'lv7', but keep '0' and decimals like '0.5'
+    normalised = normalised.str.replace(r'(?<![\d.])0+(?=\d)', '', regex=True)
+    return normalised.where(series.notnull())
+
+def fingerprint(df, columns, normalise=False):
+    """
+    Hash the combination of the given columns of every row into a compact 64 bit integer.
+
+    Without normalisation values are compared exactly like df.duplicated does, so the fingerprints can only be compared within df.
+    """
+    keys = df[columns]
+    if normalise:
+        keys = keys.apply(normalise_values)
+    else:
+        # hash_pandas_object compares columns of mixed types on their text, which would make 7 and '7' equal
+        mixed = [column for column in columns if pd.api.types.infer_dtype(keys[column], skipna=True).startswith('mixed')]
+        if mixed:
+            keys = keys.copy()
+            for column in mixed:
+                keys[column] = pd.factorize(keys[column])[0]
+    return pd.util.hash_pandas_object(keys, index=False)
+
+def duplicate_clusters(df, columns, normalise=False):
+    """
+    Group the rows that share the same key over the given columns.
+
+    Parameters:
+        df (pd.DataFrame): dataframe with a 'Row_Number' column, rows with a missing key value should be removed
+        columns (list): one or more columns that together form the key
+        normalise (bool): compare normalised values, see normalise_values
+
+    Returns:
+        clusters (list): one list of row numbers per duplicated key, in order of first appearance
+    """
+    fingerprints = fingerprint(df, columns, normalise)
+    duplicated = fingerprints.duplicated(keep=False).to_numpy()
+    if not duplicated.any():
+        return []
+    rows = df['Row_Number'][duplicated]
+    return [list(group) for _, group in rows.groupby(fingerprints[duplicated].to_numpy(), sort=False)]
+
+# Values that are neither text nor a number are hashed on their text with another key, so they don't equal that text
+OTHER_HASH_KEY = 'labfilechecker00'
+
+def id_hashes(series):
+    """
+    Hash IDs into 64 bit integers that compare like Series.isin does.
+
+    Text is hashed on its text and numbers on their value, so 7 and 7.0 are the same ID but '7' isn't. Missing values all get the same hash.
+    """
+    def hash_values(values, hash_key=None):
+        keys = {'hash_key': hash_key} if hash_key else {}
+        return pd.util.hash_pandas_object(values, index=False, **keys).to_numpy()
+
+    missing = series.isnull().to_numpy()
+    values = series[~missing]
+    kind = pd.api.types.infer_dtype(values, skipna=False)
+
+    hashes = np.empty(len(series), dtype=np.uint64)
+    hashes[missing] = hash_values(pd.Series(['']), OTHER_HASH_KEY)[0]
+    if kind in ['string', 'empty']:
+        hashes[~missing] = hash_values(values)
+    elif kind in ['integer', 'floating', 'mixed-integer-float', 'decimal']:
+        hashes[~missing] = hash_values(values.astype('float64'))
+    else:
+        is_text = values.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+        is_number = values.map(lambda v: isinstance(v, (int, float, np.number)) and not isinstance(v, (bool, np.bool_))).to_numpy(dtype=bool)
+        is_other = ~is_text & ~is_number
+        value_hashes = np.empty(len(values), dtype=np.uint64)
+        value_hashes[is_text] = hash_values(values[is_text])
+        value_hashes[is_number] = hash_values(values[is_number].astype('float64'))
+        value_hashes[is_other] = hash_values(values[is_other].astype(str), OTHER_HASH_KEY)
+        hashes[~missing] = value_hashes
+    return hashes
+
+def referred_ids(series):
+    """The sorted unique id_hashes of a column that other columns refer to"""
+    return np.unique(id_hashes(series))
+
+def is_referred(series, referred):
+    """
+    Check which values are one of the referred IDs, like series.isin(referred_column).
+
+    Parameters:
+        series (pd.Series): the referring values
+        referred (np.ndarray): referred_ids of the referred column
+
+    Returns:
+        found (np.ndarray): boolean array with the same length as series
+    """
+    hashes = id_hashes(series)
+    if len(referred) == 0:
+        return np.zeros(len(hashes), dtype=bool)
+    positions = np.searchsorted(referred, hashes).clip(max=len(referred) - 1)
+    return referred[positions] == hashes
+
+# Excel counts days from 1899-12-30 (it wrongly assumes 1900 was a leap year), up to 9999-12-31
+EXCEL_EPOCH = pd.Timestamp('1899-12-30')
+EXCEL_MAX_SERIAL = 2958465
+# pandas >= 2 infers one format from the first value, 'mixed' parses every value on its own like pandas 1 did
+INFER_FORMAT = {'format': 'mixed'} if int(pd.__version__.split('.')[0]) >= 2 else {}
+
+def parse_dates(series, date_format=None):
+    """
+    Parse a column of raw excel values to dates.
+
+    Only the unique values are parsed and the results are mapped back to the column, numbers are read as excel serial dates.
+
+    Parameters:
+        series (pd.Series): raw values of a date column
+        date_format (str): strftime format of the text values, e.g. '%d/%m/%Y'. The format is inferred per value if None
+
+    Returns:
+        dates (pd.Series): parsed dates with the same index as series, NaT where a value is missing or isn't a date
+    """
+    codes, uniques = pd.factorize(series)
+    if len(uniques) == 0:
+        return pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+
+    uniques = pd.Series(uniques, dtype=object)
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype='datetime64[ns]')
+
+    is_number = uniques.map(lambda v: isinstance(v, (int, float, np.number)) and not isinstance(v, (bool, np.bool_)))
+    is_text = uniques.map(lambda v: isinstance(v, str))
+    is_date = ~is_number & ~is_text
+
+    if is_number.any():
+        serials = uniques[is_number].astype(float)
+        serials = serials[(serials >= 1) & (serials <= EXCEL_MAX_SERIAL)]
+        parsed[serials.index] = EXCEL_EPOCH + pd.to_timedelta(serials, unit='D')
+    if is_text.any():
+        text = uniques[is_text].str.strip()
+        if date_format:
+            parsed[text.index] = pd.to_datetime(text, format=date_format, errors='coerce')
+        else:
+            parsed[text.index] = pd.to_datetime(text, errors='coerce', **INFER_FORMAT)
+    if is_date.any():
+        parsed[is_date] = pd.to_datetime(uniques[is_date], errors='coerce')
+
+    dates = pd.Series(parsed.to_numpy()[codes], index=series.index)
+    return dates.where(codes >= 0)
+
+def date_range(config_column):
+    """The range of realistic dates of a date column: Min_date and Max_date from the config, defaults to the last 6 years"""
+    today = pd.to_datetime('today').floor('D')
+    min_date = config_date(config_column, 'Min_date') if 'Min_date' in config_column else today - pd.DateOffset(years=6)
+    max_date = config_date(config_column, 'Max_date') if 'Max_date' in config_column else today
+    return min_date, max_date
+
+def config_date(config_column, key):
+    """Read a date like '2017-01-01' or 'today' from the config, raises a ValueError naming the column if it isn't one"""
+    value = config_column[key]
+    try:
+        date = pd.to_datetime(value)
+    except (ValueError, TypeError, OverflowError):
+        date = pd.NaT
+    if pd.isnull(date):
+        raise ValueError(f"{key} '{value}' of column {config_column['Column_name']} is not a date")
+    return date.floor('D')
+
+@functools.lru_cache(maxsize=None)
+def compile_pattern(pattern):
+    """Compile a regular expression once per run"""
+    return re.compile(pattern)
+
+# Number of leading values from which match_unique guesses if a column repeats its values
+CARDINALITY_SAMPLE = 10000
+
+def match_unique(series, pattern, search=False, missing=False):
+    """
+    Match a regular expression against a column with the vectorised string methods of pandas.
+
+    Columns that repeat their values, like most lab columns, only have their unique values matched.
+
+    Parameters:
+        series (pd.Series): values to match, non-text values are matched as text
+        pattern (str): the regular expression
+        search (bool): look for the pattern anywhere in the value instead of matching the complete value
+        missing (bool): result for missing values
+
+    Returns:
+        matched (np.ndarray): boolean array with the same length as series
+    """
+    # Compiling first reports an invalid pattern as a re.error, whatever the column holds
+    regex = compile_pattern(pattern)
+    # values that are equal but not identical, like 1 and 1.0, should be matched on their own text
+    if pd.api.types.infer_dtype(series, skipna=True) != 'string':
+        series = series.astype(str).where(series.notnull())
+
+    head = series.iloc[:CARDINALITY_SAMPLE]
+    if head.nunique() * 2 < len(head):
+        codes, uniques = pd.factorize(series)
+        matched = _match(pd.Series(uniques), regex, search, missing)
+        # the missing values have code -1, which picks the appended value
+        return np.append(matched, missing)[codes]
+    return _match(series, regex, search, missing)
+
+def _match(series, regex, search, missing):
+    method = series.str.contains if search else series.str.fullmatch
+    return method(regex, na=missing).to_numpy(dtype=bool)
+
+def convert_cell(cell):
+    """Convert an openpyxl cell the way pandas.read_excel does"""
+    if cell.value is None:
+        return ""
+    elif cell.data_type == TYPE_ERROR:
+        return np.nan
+    elif cell.data_type == TYPE_NUMERIC:
+        value = int(cell.value)
+        return value if value == cell.value else float(cell.value)
+    return cell.value
+
+def is_blank(value):
+    """Empty cells and cells with only whitespace"""
+    return value == "" or (isinstance(value, str) and not value.strip())
+
+# Formats openpyxl can read, other formats like .xls, .ods and .xlsb are read completely by pandas
+USED_RANGE_EXTENSIONS = ['.xlsx', '.xlsm', '.xltx', '.xltm']
+
+def read_used_range(file, skip_rows, columns, na_values):
+    """
+    Read the first sheet of an excel file, limited to the range that holds data.
+
+    Lab files often carry formatting far beyond their data. Only the columns up to the last header are read and
+    the trailing rows without a value in any of the configured columns are dropped while reading. Files that
+    openpyxl can't read are read completely with pandas.read_excel.
+
+    Parameters:
+        file (str): path to the excel file
+        skip_rows (int): number of rows above the header
+        columns (list): configured column names, if none of them is in the header all columns are used
+        na_values (list): values that are read as missing
+
+    Returns:
+        df (pd.DataFrame): the data of the used range, like pandas.read_excel would read it
+        sheet (str): name of the sheet
+        ignored_rows (int): number of dropped trailing rows that hold a value
+        ignored_columns (int): number of dropped columns after the header that hold a value
+    """
+    if os.path.splitext(file)[1].lower() not in USED_RANGE_EXTENSIONS:
+        with pd.ExcelFile(file) as excel_file:
+            sheet = excel_file.sheet_names[0]
+            df = pd.read_excel(excel_file, sheet_name=sheet, skiprows=skip_rows, na_values=na_values, keep_default_na=False)
+        return df, sheet, 0, 0
+
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True, keep_links=False)
+    try:
+        worksheet = workbook.worksheets[0]
+        # The stored dimensions are unreliable, use the cells that are really in the file
+        worksheet.reset_dimensions()
+
+        header_cells = next(worksheet.iter_rows(min_row=skip_rows + 1, max_row=skip_rows + 1), ())
+        header = [convert_cell(cell) for cell in header_cells]
+        width = max([i + 1 for i, value in enumerate(header) if not is_blank(value)], default=0)
+        # Columns up to the last cell with a value in any row are what read_excel would return
+        extent = max([i + 1 for i, cell in enumerate(header_cells) if cell.value is not None], default=0)
+        if width == 0:
+            return pd.DataFrame(), worksheet.title, 0, extent
+
+        checked = [i for i, value in enumerate(header[:width]) if str(value).strip() in columns] or list(range(width))
+        data = [header[:width]]
+        # Rows without data are only counted until another row with data follows, the few that hold a value
+        # outside the checked columns are kept by their position among them, the others come back empty
+        pending = 0
+        pending_values = 0
+        partial = {}
+        for row in worksheet.iter_rows(min_row=skip_rows + 2):
+            # Cells that are only formatted have no value, read_excel doesn't return them either
+            last = max([i + 1 for i, cell in enumerate(row) if cell.value is not None], default=0)
+            extent = max(extent, last)
+            converted_row = [convert_cell(cell) for cell in row[:width]]
+            converted_row += [""] * (width - len(converted_row))
+            if any(not is_blank(converted_row[i]) for i in checked):
+                data.extend(partial.get(i, [""] * width) for i in range(pending))
+                pending = 0
+                pending_values = 0
+                partial = {}
+                data.append(converted_row)
+            else:
+                if not all(is_blank(value) for value in converted_row):
+                    partial[pending] = converted_row
+                pending += 1
+                pending_values += last > 0
+        sheet = worksheet.title
+    finally:
+        workbook.close()
+
+    df = TextParser(data, header=0, na_values=na_values, keep_default_na=False, skip_blank_lines=False).read()
+    return df, sheet, pending_values, max(extent - width, 0)